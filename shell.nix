@@ -6,6 +6,7 @@
 let
   python3 = pkgs.python3.withPackages (p: with p; [
     jaconv
+    orjson
   ]);
 in
   pkgs.mkShell {